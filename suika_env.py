@@ -1,16 +1,194 @@
 # suika_env.py
-# Minimal Suika-like environment for RL + human play (pygame only).
-# pip install pygame
+# Minimal Suika-like environment for RL + human play (pygame + numpy).
+# pip install pygame numpy
 
+import bisect
+import itertools
 import math
 import random
 from dataclasses import dataclass
 
+try:
+    import numpy as np
+except ImportError as e:
+    raise SystemExit("numpy is required. Install with: pip install numpy") from e
+
 try:
     import pygame
 except ImportError as e:
     raise SystemExit("pygame is required. Install with: pip install pygame") from e
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None  # optional; the interpreter fallback below still works
+
+
+def _resolve_pairs_scalar(x, y, vx, vy, r, pairs, e, fr):
+    # Narrow phase: positional correction + impulse for each candidate pair,
+    # in-place on the SoA arrays. Compiled with numba when available.
+    for k in range(pairs.shape[0]):
+        i = pairs[k, 0]
+        j = pairs[k, 1]
+        dx = x[j] - x[i]
+        dy = y[j] - y[i]
+        dist2 = dx * dx + dy * dy
+        rs = r[i] + r[j]
+        if dist2 >= rs * rs or dist2 <= 1e-12:
+            continue
+
+        dist = math.sqrt(dist2)
+        nx = dx / dist
+        ny = dy / dist
+
+        # positional correction (split overlap)
+        overlap = (rs - dist)
+        x[i] -= nx * (overlap * 0.5)
+        y[i] -= ny * (overlap * 0.5)
+        x[j] += nx * (overlap * 0.5)
+        y[j] += ny * (overlap * 0.5)
+
+        # relative velocity along normal
+        rvx = vx[j] - vx[i]
+        rvy = vy[j] - vy[i]
+        vn = rvx * nx + rvy * ny
+        if vn > 0:
+            continue  # separating
+
+        # impulse (equal mass)
+        jimp = -(1.0 + e) * vn * 0.5
+        vx[i] -= jimp * nx
+        vy[i] -= jimp * ny
+        vx[j] += jimp * nx
+        vy[j] += jimp * ny
+
+        # simple tangential friction
+        tx = -ny
+        ty = nx
+        vt = rvx * tx + rvy * ty
+        jt = -vt * fr * 0.5
+        vx[i] -= jt * tx
+        vy[i] -= jt * ty
+        vx[j] += jt * tx
+        vy[j] += jt * ty
+
+
+def _resolve_pairs_numpy(x, y, vx, vy, r, pairs, e, fr):
+    # Interpreter narrow phase: compute every pair quantity in one
+    # vectorized pass over a snapshot of the arrays, then scatter the
+    # corrections with np.add.at (unbuffered, so pairs sharing a fruit
+    # still accumulate). Unlike the sequential kernel, later pairs do not
+    # see earlier pairs' writes within the same call; the difference is
+    # absorbed by the solver iterating every substep.
+    ai = pairs[:, 0]
+    bi = pairs[:, 1]
+    dx = x[bi] - x[ai]
+    dy = y[bi] - y[ai]
+    d2 = dx * dx + dy * dy
+    rs = r[ai] + r[bi]
+    hit = (d2 < rs * rs) & (d2 > 1e-12)
+    if not hit.any():
+        return
+    ai, bi = ai[hit], bi[hit]
+    dx, dy, d2, rs = dx[hit], dy[hit], d2[hit], rs[hit]
+
+    dist = np.sqrt(d2)
+    nx = dx / dist
+    ny = dy / dist
+
+    # positional correction (split overlap)
+    half = (rs - dist) * 0.5
+    np.add.at(x, ai, -nx * half)
+    np.add.at(y, ai, -ny * half)
+    np.add.at(x, bi, nx * half)
+    np.add.at(y, bi, ny * half)
+
+    # impulse + tangential friction, only for approaching pairs
+    rvx = vx[bi] - vx[ai]
+    rvy = vy[bi] - vy[ai]
+    vn = rvx * nx + rvy * ny
+    appr = vn <= 0
+    jimp = np.where(appr, -(1.0 + e) * vn * 0.5, 0.0)
+    np.add.at(vx, ai, -jimp * nx)
+    np.add.at(vy, ai, -jimp * ny)
+    np.add.at(vx, bi, jimp * nx)
+    np.add.at(vy, bi, jimp * ny)
+
+    tx = -ny
+    ty = nx
+    vt = rvx * tx + rvy * ty
+    jt = np.where(appr, -vt * fr * 0.5, 0.0)
+    np.add.at(vx, ai, -jt * tx)
+    np.add.at(vy, ai, -jt * ty)
+    np.add.at(vx, bi, jt * tx)
+    np.add.at(vy, bi, jt * ty)
+
+
+if njit is not None:
+    _resolve_pairs = njit(cache=True)(_resolve_pairs_scalar)
+else:
+    _resolve_pairs = _resolve_pairs_numpy
+
+
+def _make_substep_kernel(cfg):
+    # Specialize integration + wall/floor resolution on a fixed cfg: the
+    # fields are captured as closure constants, so numba folds them into the
+    # compiled code and the kernel does no config loads per call. Returns
+    # None without numba (callers fall back to the NumPy path). The kernel
+    # bakes cfg in at build time; rebuild it if cfg is mutated afterwards.
+    if njit is None:
+        return None
+
+    g = float(cfg.g)
+    damp = float(cfg.vel_damp)
+    vmax = float(cfg.max_speed)
+    L = float(cfg.left_x)
+    R = float(cfg.right_x)
+    floor = float(cfg.floor_y)
+    e = float(cfg.restitution)
+    fr = float(cfg.friction)
+
+    @njit
+    def _substep(x, y, vx, vy, r, n, dt):
+        for i in range(n):
+            vxi = vx[i] * damp
+            vyi = (vy[i] + g * dt) * damp
+
+            sp = math.sqrt(vxi * vxi + vyi * vyi)
+            if sp > vmax:
+                k = vmax / sp
+                vxi *= k
+                vyi *= k
+
+            xi = x[i] + vxi * dt
+            yi = y[i] + vyi * dt
+            ri = r[i]
+
+            if xi - ri < L:
+                xi = L + ri
+                if vxi < 0:
+                    vxi = -vxi * (1.0 - e)
+                vyi *= (1.0 - fr)
+
+            if xi + ri > R:
+                xi = R - ri
+                if vxi > 0:
+                    vxi = -vxi * (1.0 - e)
+                vyi *= (1.0 - fr)
+
+            if yi + ri > floor:
+                yi = floor - ri
+                if vyi > 0:
+                    vyi = -vyi * (1.0 - e)
+                vxi *= (1.0 - fr)
+
+            x[i] = xi
+            y[i] = yi
+            vx[i] = vxi
+            vy[i] = vyi
+
+    return _substep
+
 
 @dataclass
 class EnvConfig:
@@ -40,6 +218,14 @@ class EnvConfig:
     friction: float = 0.10     # simple tangential damping
     vel_damp: float = 0.999    # global damping
     max_speed: float = 2500.0
+    broadphase: str = "sweep"  # "sweep" | "grid" | "brute"
+    # Sleeping: skip physics once everything has settled. Stillness is
+    # judged on per-frame displacement, not velocity: a resting pile keeps
+    # ~30 px/s of impulse-chain jitter in its velocities while positions
+    # barely move, and a bounce apex is the opposite.
+    sleep_disp_eps: float = 0.6   # px of per-frame movement counted as still
+    sleep_wake_time: float = 0.5  # sec awake after a drop or merge
+    sleep_still_frames: int = 3   # consecutive still frames before sleeping
 
     # Game limits
     max_fruits: int = 70
@@ -47,6 +233,48 @@ class EnvConfig:
     seed: int | None = None
 
 
+class SpatialHash:
+    """
+    Uniform-grid broadphase for circles.
+
+    Cell size should be >= 2 * max_radius so any overlapping pair is at most
+    one cell apart on each axis; candidate pairs then come from each cell and
+    the forward half of its 3x3 neighborhood (no duplicates, i < j).
+    """
+
+    def __init__(self, cell_size):
+        self.inv_cell = 1.0 / float(cell_size)
+        self.cells = {}
+
+    def build(self, x, y, n):
+        self.cells.clear()
+        inv = self.inv_cell
+        cells = self.cells
+        for i in range(n):
+            key = (int(x[i] * inv), int(y[i] * inv))
+            if key in cells:
+                cells[key].append(i)
+            else:
+                cells[key] = [i]
+
+    def pairs(self):
+        cells = self.cells
+        out = []
+        for (cx, cy), idxs in cells.items():
+            k = len(idxs)
+            for a in range(k):
+                ia = idxs[a]
+                for b in range(a + 1, k):
+                    out.append((ia, idxs[b]))
+            for dx, dy in ((1, -1), (1, 0), (1, 1), (0, 1)):
+                other = cells.get((cx + dx, cy + dy))
+                if other:
+                    for i in idxs:
+                        for j in other:
+                            out.append((i, j) if i < j else (j, i))
+        return out
+
+
 class SuikaEnv:
     """
     Action: (move, drop)
@@ -63,6 +291,28 @@ class SuikaEnv:
     def __init__(self, cfg: EnvConfig | None = None):
         self.cfg = cfg or EnvConfig()
         self.rng = random.Random(self.cfg.seed)
+
+        # type-indexed lookup tables (radius tuned for W=480-ish)
+        mt = self.cfg.max_type
+        self._radius_table = np.array([16.0 + t * 6.0 for t in range(mt + 1)])
+        self._score_table = np.array([2 ** t for t in range(mt + 1)], dtype=np.int64)
+        rs = self._radius_table[:, None] + self._radius_table[None, :]
+        self._rs2_table = rs * rs  # squared radius sums, indexed [type_i, type_j]
+
+        max_r = self._radius_for_type(self.cfg.max_type)
+        self._grid = SpatialHash(2.0 * max_r)
+        self._substep = _make_substep_kernel(self.cfg)  # None without numba
+
+        # created on first render() call (pygame.font needs pygame.init())
+        self._hud_font = None
+        self._big_font = None
+
+        # Next-fruit distribution: mostly small fruits. You can tweak the
+        # weights freely; the CDF is cached so sampling stays allocation-free.
+        weights = [3, 2, 1, 0, 0, 0, 0, 0, 0, 0, 0][: self.cfg.max_type + 1]
+        self._type_cdf = list(itertools.accumulate(weights))
+        self._type_total = self._type_cdf[-1]
+
         self.reset()
 
     # ---------- Public API ----------
@@ -71,10 +321,21 @@ class SuikaEnv:
         self.done = False
         self.t = 0.0
 
-        self.fruits = []  # each fruit: dict {type,x,y,vx,vy,r}
+        # Fruits stored as parallel arrays (SoA); the first self.n entries are live.
+        m = self.cfg.max_fruits
+        self.n = 0
+        self.x = np.zeros(m, dtype=np.float64)
+        self.y = np.zeros(m, dtype=np.float64)
+        self.vx = np.zeros(m, dtype=np.float64)
+        self.vy = np.zeros(m, dtype=np.float64)
+        self.r = np.zeros(m, dtype=np.float64)
+        self.type = np.zeros(m, dtype=np.int8)
+
         self.cursor_x = (self.cfg.left_x + self.cfg.right_x) * 0.5
         self.next_type = self._sample_next_type()
         self._last_merge_count = 0
+        self._awake_until = 0.0
+        self._still_frames = 0
         return self._get_obs()
 
     def step(self, action):
@@ -85,31 +346,44 @@ class SuikaEnv:
         move = float(max(-1.0, min(1.0, move)))
         drop = int(drop != 0)
 
-        dt = 1.0 / self.cfg.FPS
+        cfg = self.cfg
+        dt = 1.0 / cfg.FPS
         reward = 0.0
         info = {}
 
         # cursor move
-        self.cursor_x += move * self.cfg.move_speed * dt
-        self.cursor_x = max(self.cfg.left_x + 5.0, min(self.cfg.right_x - 5.0, self.cursor_x))
+        self.cursor_x += move * cfg.move_speed * dt
+        self.cursor_x = max(cfg.left_x + 5.0, min(cfg.right_x - 5.0, self.cursor_x))
 
         # drop
         if drop:
-            if len(self.fruits) >= self.cfg.max_fruits:
+            if self.n >= cfg.max_fruits:
                 self.done = True
                 return self._get_obs(), 0.0, True, {"reason": "max_fruits"}
-            self._spawn_fruit(self.next_type, self.cursor_x, self.cfg.spawn_y)
+            self._spawn_fruit(self.next_type, self.cursor_x, cfg.spawn_y)
             self.next_type = self._sample_next_type()
+            self._awake_until = self.t + cfg.sleep_wake_time
 
-        # physics
-        sub_dt = dt / self.cfg.substeps
+        # physics (skipped entirely while the whole container sleeps);
+        # the substep count adapts to the fastest fruit, capped at cfg
+        substeps = 0 if self._sleeping() else self._required_substeps(dt)
+        sub_dt = dt / max(1, substeps)
         prev_score = self.score
         self._last_merge_count = 0
 
-        for _ in range(self.cfg.substeps):
-            self._integrate(sub_dt)
-            self._solve_collisions()
-            self._merge_pass(max_merges=8)  # avoid infinite loops per frame
+        if substeps:
+            px = self.x[:self.n].copy()
+            py = self.y[:self.n].copy()
+        for _ in range(substeps):
+            if self._substep is not None:
+                self._substep(self.x, self.y, self.vx, self.vy, self.r, self.n, sub_dt)
+            else:
+                self._integrate(sub_dt)
+                self._solve_walls()
+            cand = self._solve_collisions()
+            self._merge_pass(cand, max_merges=8)  # avoid infinite loops per frame
+        if substeps:
+            self._update_still(px, py)
 
         # lose condition
         if self._check_lose():
@@ -123,245 +397,315 @@ class SuikaEnv:
     # ---------- Observation ----------
     def _get_obs(self):
         # Normalize positions within container area
-        w = (self.cfg.right_x - self.cfg.left_x)
-        h = (self.cfg.floor_y - self.cfg.lose_line_y)
-        cx = (self.cursor_x - self.cfg.left_x) / max(1e-6, w)
-
-        fruits_out = []
-        for f in self.fruits:
-            x_n = (f["x"] - self.cfg.left_x) / max(1e-6, w)
-            y_n = (f["y"] - self.cfg.lose_line_y) / max(1e-6, h)
-            vx_n = f["vx"] / self.cfg.max_speed
-            vy_n = f["vy"] / self.cfg.max_speed
-            r_n = f["r"] / w
-            fruits_out.append((f["type"], x_n, y_n, vx_n, vy_n, r_n))
+        cfg = self.cfg
+        w = (cfg.right_x - cfg.left_x)
+        h = (cfg.floor_y - cfg.lose_line_y)
+        cx = (self.cursor_x - cfg.left_x) / max(1e-6, w)
+
+        # normalize all columns in one NumPy pass, then zip into tuples
+        n = self.n
+        inv_w = 1.0 / max(1e-6, w)
+        inv_h = 1.0 / max(1e-6, h)
+        inv_v = 1.0 / cfg.max_speed
+        x_n = (self.x[:n] - cfg.left_x) * inv_w
+        y_n = (self.y[:n] - cfg.lose_line_y) * inv_h
+        vx_n = self.vx[:n] * inv_v
+        vy_n = self.vy[:n] * inv_v
+        r_n = self.r[:n] * inv_w
+        fruits_out = list(zip(
+            self.type[:n].tolist(),
+            x_n.tolist(),
+            y_n.tolist(),
+            vx_n.tolist(),
+            vy_n.tolist(),
+            r_n.tolist(),
+        ))
 
         return {
             "next": int(self.next_type),
             "cursor_x": float(cx),
             "score": int(self.score),
             "fruits": fruits_out,
-            "n_fruits": len(self.fruits),
+            "n_fruits": n,
             "last_merges": int(self._last_merge_count),
         }
 
     # ---------- Game rules ----------
     def _sample_next_type(self):
-        # Suika-like: mostly small fruits
-        # You can tweak weights freely.
-        # types: 0..max_type
-        weights = [3, 2, 1, 0, 0, 0, 0, 0, 0, 0, 0]
-        weights = weights[: self.cfg.max_type + 1]
-        total = sum(weights)
-        r = self.rng.uniform(0.0, total)
-        acc = 0.0
-        for i, w in enumerate(weights):
-            acc += w
-            if r <= acc:
-                return i
-        return 0
+        # types: 0..max_type, sampled from the CDF cached in __init__
+        r = self.rng.random() * self._type_total
+        return bisect.bisect_left(self._type_cdf, r)
 
     def _radius_for_type(self, t):
-        # increasing circle size
-        # tuned for W=480-ish
-        base = 16.0
-        return base + t * 6.0
+        # increasing circle size (precomputed in __init__)
+        return float(self._radius_table[t])
 
     def _score_for_merge(self, new_type):
         # simple scoring: bigger fruit -> more score
-        # you can change to match the real game.
-        return int(2 ** max(0, new_type))
+        # you can change to match the real game (table built in __init__).
+        return int(self._score_table[new_type])
 
     def _spawn_fruit(self, t, x, y):
-        r = self._radius_for_type(t)
-        self.fruits.append({
-            "type": int(t),
-            "x": float(x),
-            "y": float(y),
-            "vx": 0.0,
-            "vy": 0.0,
-            "r": float(r),
-        })
+        # plain array stores; the dtypes coerce, no float()/int() needed
+        i = self.n
+        self.type[i] = t
+        self.x[i] = x
+        self.y[i] = y
+        self.vx[i] = 0.0
+        self.vy[i] = 0.0
+        self.r[i] = self._radius_table[t]
+        self.n = i + 1
+
+    def _swap_pop(self, idx):
+        # O(1) removal: move the tail fruit into the freed slot
+        last = self.n - 1
+        if idx != last:
+            for arr in (self.x, self.y, self.vx, self.vy, self.r, self.type):
+                arr[idx] = arr[last]
+        self.n = last
 
     # ---------- Physics ----------
+    def _sleeping(self):
+        # The container sleeps once the wake window after the last drop or
+        # merge has passed, nothing has moved for several consecutive
+        # frames (counter maintained by _update_still), and every fruit is
+        # supported. One still frame alone is not enough: the apex of a
+        # bounce also moves very little for a frame or two, and sleeping
+        # there would freeze a fruit in mid-air — hence the Box2D-style
+        # hysteresis plus the support check.
+        if self.t <= self._awake_until:
+            return False
+        need = self.cfg.sleep_still_frames
+        if self._still_frames < need:
+            return False
+        if self._still_frames == need:
+            if not self._all_supported():
+                self._still_frames = 0
+                return False
+            # support verified; bump past the threshold so the check is
+            # not repeated every frame while asleep (nothing moves)
+            self._still_frames = need + 1
+        return True
+
+    def _update_still(self, px, py):
+        # Called after the substep loop with the frame-start positions.
+        # A merge reshuffles slots (and reopens the wake window anyway),
+        # so the comparison is only meaningful without one.
+        n = self.n
+        if self._last_merge_count or n != px.shape[0]:
+            self._still_frames = 0
+            return
+        moved = np.abs(self.x[:n] - px) + np.abs(self.y[:n] - py)
+        if bool((moved < self.cfg.sleep_disp_eps).all()):
+            self._still_frames += 1
+        else:
+            self._still_frames = 0
+
+    def _all_supported(self):
+        # A fruit is supported if it touches the floor or, transitively, a
+        # supported fruit; anything else is airborne and must not sleep.
+        n = self.n
+        slack = 1.0
+        x, y, r = self.x[:n], self.y[:n], self.r[:n]
+        supported = (y + r) >= (self.cfg.floor_y - slack)
+        frontier = np.where(supported)[0].tolist()
+        while frontier and not supported.all():
+            i = frontier.pop()
+            dx = x - x[i]
+            dy = y - y[i]
+            rs = r + r[i] + slack
+            new = (dx * dx + dy * dy <= rs * rs) & ~supported
+            if new.any():
+                idxs = np.where(new)[0]
+                supported[idxs] = True
+                frontier.extend(idxs.tolist())
+        return bool(supported.all())
+
+    def _required_substeps(self, dt):
+        # Enough substeps that the fastest fruit travels at most half the
+        # smallest radius per substep; cfg.substeps stays the upper bound so
+        # high-energy frames behave exactly as before.
+        n = self.n
+        if n == 0:
+            return 1
+        vmax_now = float(np.max(np.hypot(self.vx[:n], self.vy[:n])))
+        need = math.ceil(vmax_now * dt / (0.5 * self._radius_table[0]))
+        return max(1, min(self.cfg.substeps, need))
+
     def _integrate(self, dt):
         g = self.cfg.g
         damp = self.cfg.vel_damp
         vmax = self.cfg.max_speed
 
-        for f in self.fruits:
-            f["vy"] += g * dt
-            f["vx"] *= damp
-            f["vy"] *= damp
-
-            # clamp speed
-            sp = math.hypot(f["vx"], f["vy"])
-            if sp > vmax:
-                k = vmax / max(1e-9, sp)
-                f["vx"] *= k
-                f["vy"] *= k
-
-            f["x"] += f["vx"] * dt
-            f["y"] += f["vy"] * dt
-
-    def _solve_collisions(self):
-        # walls/floor
+        n = self.n
+        if n == 0:
+            return
+        x, y = self.x[:n], self.y[:n]
+        vx, vy = self.vx[:n], self.vy[:n]
+
+        vy += g * dt
+        vx *= damp
+        vy *= damp
+
+        # clamp speed: flooring the squared speed at vmax^2 keeps k <= 1,
+        # so slow fruits are untouched and no per-element branch is needed
+        k = vmax / np.sqrt(np.maximum(vx * vx + vy * vy, vmax * vmax))
+        vx *= k
+        vy *= k
+
+        x += vx * dt
+        y += vy * dt
+
+    def _candidate_pairs(self):
+        # Broadphase: prune far-apart pairs before the narrow phase. Below
+        # ~32 fruits neither structure pays for its build, so brute-force.
+        n = self.n
+        broadphase = self.cfg.broadphase
+        if n < 32 or broadphase == "brute":
+            return [(i, j) for i in range(n) for j in range(i + 1, n)]
+        if broadphase == "grid":
+            self._grid.build(self.x, self.y, n)
+            return self._grid.pairs()
+        return self._sweep_pairs()
+
+    def _sweep_pairs(self):
+        # Sort-and-sweep along x: only fruits whose [x-r, x+r] intervals
+        # overlap can touch. Cheaper to build than the grid at this scale.
+        n = self.n
+        lo = self.x[:n] - self.r[:n]
+        hi = (self.x[:n] + self.r[:n]).tolist()
+        y = self.y[:n].tolist()
+        r = self.r[:n].tolist()
+        out = []
+        active = []
+        for i in np.argsort(lo, kind="stable").tolist():
+            li = lo[i]
+            # drop intervals that ended before this one starts
+            active = [j for j in active if hi[j] >= li]
+            ri = r[i]
+            yi = y[i]
+            for j in active:
+                if abs(yi - y[j]) < ri + r[j]:
+                    out.append((i, j) if i < j else (j, i))
+            active.append(i)
+        return out
+
+    def _solve_walls(self):
+        # walls/floor (NumPy fallback; the compiled substep kernel fuses this)
         L, R = self.cfg.left_x, self.cfg.right_x
         floor = self.cfg.floor_y
         e = self.cfg.restitution
         fr = self.cfg.friction
 
-        for f in self.fruits:
-            r = f["r"]
-
-            # left wall
-            if f["x"] - r < L:
-                f["x"] = L + r
-                if f["vx"] < 0:
-                    f["vx"] = -f["vx"] * (1.0 - e)
-                f["vy"] *= (1.0 - fr)
-
-            # right wall
-            if f["x"] + r > R:
-                f["x"] = R - r
-                if f["vx"] > 0:
-                    f["vx"] = -f["vx"] * (1.0 - e)
-                f["vy"] *= (1.0 - fr)
-
-            # floor
-            if f["y"] + r > floor:
-                f["y"] = floor - r
-                if f["vy"] > 0:
-                    f["vy"] = -f["vy"] * (1.0 - e)
-                f["vx"] *= (1.0 - fr)
-
-        # circle-circle collisions (naive O(n^2))
-        n = len(self.fruits)
-        for i in range(n):
-            a = self.fruits[i]
-            for j in range(i + 1, n):
-                b = self.fruits[j]
-                dx = b["x"] - a["x"]
-                dy = b["y"] - a["y"]
-                dist2 = dx * dx + dy * dy
-                rs = a["r"] + b["r"]
-                if dist2 >= rs * rs or dist2 <= 1e-12:
-                    continue
-
-                dist = math.sqrt(dist2)
-                nx = dx / dist
-                ny = dy / dist
-
-                # positional correction (split overlap)
-                overlap = (rs - dist)
-                a["x"] -= nx * (overlap * 0.5)
-                a["y"] -= ny * (overlap * 0.5)
-                b["x"] += nx * (overlap * 0.5)
-                b["y"] += ny * (overlap * 0.5)
-
-                # relative velocity along normal
-                rvx = b["vx"] - a["vx"]
-                rvy = b["vy"] - a["vy"]
-                vn = rvx * nx + rvy * ny
-                if vn > 0:
-                    continue  # separating
-
-                # impulse (equal mass)
-                e = self.cfg.restitution
-                jimp = -(1.0 + e) * vn * 0.5
-                a["vx"] -= jimp * nx
-                a["vy"] -= jimp * ny
-                b["vx"] += jimp * nx
-                b["vy"] += jimp * ny
-
-                # simple tangential friction
-                tx = -ny
-                ty = nx
-                vt = rvx * tx + rvy * ty
-                jt = -vt * self.cfg.friction * 0.5
-                a["vx"] -= jt * tx
-                a["vy"] -= jt * ty
-                b["vx"] += jt * tx
-                b["vy"] += jt * ty
+        n = self.n
+        if n == 0:
+            return
+        x, y = self.x[:n], self.y[:n]
+        vx, vy = self.vx[:n], self.vy[:n]
+        r = self.r[:n]
+
+        # left wall (reflect only if moving into the wall)
+        m = x - r < L
+        x[m] = L + r[m]
+        mv = m & (vx < 0)
+        vx[mv] = -vx[mv] * (1.0 - e)
+        vy[m] *= (1.0 - fr)
+
+        # right wall
+        m = x + r > R
+        x[m] = R - r[m]
+        mv = m & (vx > 0)
+        vx[mv] = -vx[mv] * (1.0 - e)
+        vy[m] *= (1.0 - fr)
+
+        # floor
+        m = y + r > floor
+        y[m] = floor - r[m]
+        mv = m & (vy > 0)
+        vy[mv] = -vy[mv] * (1.0 - e)
+        vx[m] *= (1.0 - fr)
+
+    def _solve_collisions(self):
+        # circle-circle collisions (broadphase + compiled narrow phase).
+        # Returns the candidate list so the merge pass can reuse it.
+        cand = self._candidate_pairs()
+        if cand:
+            pairs = np.asarray(cand, dtype=np.int32)
+            _resolve_pairs(self.x, self.y, self.vx, self.vy, self.r, pairs,
+                           self.cfg.restitution, self.cfg.friction)
+        return cand
 
     # ---------- Merging ----------
-    def _merge_pass(self, max_merges=8):
-        merges = 0
-        while merges < max_merges:
-            pair = self._find_merge_pair()
-            if pair is None:
-                break
-            i, j = pair
-            if i > j:
-                i, j = j, i
-            a = self.fruits[i]
-            b = self.fruits[j]
-            if a["type"] != b["type"]:
+    def _merge_pass(self, candidates, max_merges=8):
+        # Single pass: collect every mergeable pair among the broadphase
+        # candidates, greedily match them deepest-overlap-first (so the
+        # priority matches the old one-merge-at-a-time rescan), then apply
+        # all matches batched. Chained merges (new fruit overlapping its
+        # own type) resolve on the next substep's candidates.
+        if not candidates:
+            return
+        x, y, typ = self.x, self.y, self.type
+
+        p = np.asarray(candidates, dtype=np.int32)
+        i, j = p[:, 0], p[:, 1]
+        ti, tj = typ[i], typ[j]
+        dx = x[j] - x[i]
+        dy = y[j] - y[i]
+        rs2 = self._rs2_table[ti, tj]
+        d2 = dx * dx + dy * dy
+        ok = (ti == tj) & (ti < self.cfg.max_type) & (d2 < rs2)
+        if not ok.any():
+            return
+        i, j, d2, rs2 = i[ok], j[ok], d2[ok], rs2[ok]
+        overlap = np.sqrt(rs2) - np.sqrt(np.maximum(d2, 1e-12))
+
+        # greedy matching: a fruit can take part in at most one merge
+        used = set()
+        matches = []
+        for k in np.argsort(-overlap).tolist():
+            a, b = int(i[k]), int(j[k])
+            if a in used or b in used:
+                continue
+            used.add(a)
+            used.add(b)
+            matches.append((a, b))
+            if len(matches) >= max_merges:
                 break
 
-            t = a["type"]
-            if t >= self.cfg.max_type:
-                # no further merge at max
-                break
+        # new fruits at average position/velocity, sampled before any
+        # slots move
+        new_fruits = [
+            (int(typ[a]) + 1,
+             0.5 * (x[a] + x[b]),
+             0.5 * (y[a] + y[b]),
+             0.5 * (self.vx[a] + self.vx[b]),
+             0.5 * (self.vy[a] + self.vy[b]))
+            for a, b in matches
+        ]
 
-            # new fruit at average position, average velocity
-            nx = 0.5 * (a["x"] + b["x"])
-            ny = 0.5 * (a["y"] + b["y"])
-            nvx = 0.5 * (a["vx"] + b["vx"])
-            nvy = 0.5 * (a["vy"] + b["vy"])
-            new_type = t + 1
-            new_r = self._radius_for_type(new_type)
-
-            # remove higher index first
-            self.fruits.pop(j)
-            self.fruits.pop(i)
-
-            self.fruits.append({
-                "type": int(new_type),
-                "x": float(nx),
-                "y": float(ny),
-                "vx": float(nvx),
-                "vy": float(nvy),
-                "r": float(new_r),
-            })
-
-            self.score += self._score_for_merge(new_type)
-            merges += 1
-            self._last_merge_count += 1
-
-    def _find_merge_pair(self):
-        # find any overlapping same-type pair
-        n = len(self.fruits)
-        best = None
-        best_overlap = 0.0
-        for i in range(n):
-            a = self.fruits[i]
-            for j in range(i + 1, n):
-                b = self.fruits[j]
-                if a["type"] != b["type"]:
-                    continue
-                if a["type"] >= self.cfg.max_type:
-                    continue
-                dx = b["x"] - a["x"]
-                dy = b["y"] - a["y"]
-                rs = a["r"] + b["r"]
-                dist2 = dx * dx + dy * dy
-                if dist2 < rs * rs:
-                    dist = math.sqrt(max(1e-12, dist2))
-                    overlap = rs - dist
-                    # pick the deepest overlap first for stability
-                    if overlap > best_overlap:
-                        best_overlap = overlap
-                        best = (i, j)
-        return best
+        # popping in descending order never relocates a pending index
+        for idx in sorted(used, reverse=True):
+            self._swap_pop(idx)
+
+        for t, nx, ny, nvx, nvy in new_fruits:
+            k = self.n
+            self.type[k] = t
+            self.x[k] = nx
+            self.y[k] = ny
+            self.vx[k] = nvx
+            self.vy[k] = nvy
+            self.r[k] = self._radius_table[t]
+            self.n = k + 1
+            self.score += self._score_for_merge(t)
+
+        self._last_merge_count += len(matches)
+        self._awake_until = self.t + self.cfg.sleep_wake_time
 
     # ---------- Termination ----------
     def _check_lose(self):
         # Simple lose: any fruit crosses lose line (top boundary)
-        for f in self.fruits:
-            if (f["y"] - f["r"]) < self.cfg.lose_line_y:
-                return True
-        return False
+        n = self.n
+        return bool(((self.y[:n] - self.r[:n]) < self.cfg.lose_line_y).any())
 
     # ---------- Rendering / Human play ----------
     def render(self, screen):
@@ -379,11 +723,19 @@ class SuikaEnv:
         pygame.draw.rect(screen, (40, 40, 40), pygame.Rect(L, floor - 2, R - L, 4))
         pygame.draw.line(screen, (200, 60, 60), (L, lose), (R, lose), 2)
 
-        # fruits
-        for f in self.fruits:
-            color = self._color_for_type(f["type"])
-            pygame.draw.circle(screen, color, (int(f["x"]), int(f["y"])), int(f["r"]))
-            pygame.draw.circle(screen, (20, 20, 20), (int(f["x"]), int(f["y"])), int(f["r"]), 2)
+        # fruits, grouped by type so the palette lookup happens once per type
+        n = self.n
+        xs = self.x[:n].astype(int).tolist()
+        ys = self.y[:n].astype(int).tolist()
+        rs = self.r[:n].astype(int).tolist()
+        typ = self.type[:n]
+        outline = (20, 20, 20)
+        draw_circle = pygame.draw.circle
+        for t in np.unique(typ).tolist():
+            color = self._color_for_type(t)
+            for k in np.where(typ == t)[0].tolist():
+                draw_circle(screen, color, (xs[k], ys[k]), rs[k])
+                draw_circle(screen, outline, (xs[k], ys[k]), rs[k], 2)
 
         # cursor + next preview
         cx = int(self.cursor_x)
@@ -392,18 +744,21 @@ class SuikaEnv:
         nr = int(self._radius_for_type(nt))
         pygame.draw.circle(screen, (0, 0, 0), (cx, cy), nr, 2)
 
-        # HUD
-        font = pygame.font.SysFont(None, 24)
+        # HUD (fonts are cached; SysFont per frame is expensive)
+        if self._hud_font is None:
+            self._hud_font = pygame.font.SysFont(None, 24)
+        font = self._hud_font
         s1 = font.render(f"Score: {self.score}", True, (20, 20, 20))
         s2 = font.render(f"Next: {nt}", True, (20, 20, 20))
-        s3 = font.render(f"Fruits: {len(self.fruits)}  Merges(last): {self._last_merge_count}", True, (20, 20, 20))
+        s3 = font.render(f"Fruits: {self.n}  Merges(last): {self._last_merge_count}", True, (20, 20, 20))
         screen.blit(s1, (16, 8))
         screen.blit(s2, (16, 32))
         screen.blit(s3, (16, 56))
 
         if self.done:
-            big = pygame.font.SysFont(None, 56)
-            msg = big.render("GAME OVER", True, (200, 60, 60))
+            if self._big_font is None:
+                self._big_font = pygame.font.SysFont(None, 56)
+            msg = self._big_font.render("GAME OVER", True, (200, 60, 60))
             screen.blit(msg, (self.cfg.W // 2 - msg.get_width() // 2, self.cfg.H // 2 - 40))
 
     def _color_for_type(self, t):